@@ -70,6 +70,14 @@ class MultipartParser:
         max_size: The maximum size of the body data. If None, no limit is enforced.
         header_charset: The charset to use for decoding header values.
     """
-    def parse(self, data: bytes) -> None: ...
+    def parse(self, data: bytes | bytearray | memoryview) -> None: ...
+    """Feed a chunk of data to the parser.
+
+    Args:
+        data: Any bytes-like object. `bytes` are parsed without being copied.
+
+    Chunks of 64 KiB or more are parsed without holding the GIL. Meanwhile, accessing the
+    parser from another thread raises `RuntimeError: Already mutably borrowed`.
+    """
     def next_part(self) -> FormData: ...
     def next_event(self) -> MultipartPart.Header | MultipartPart.Body | None: ...
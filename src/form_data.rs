@@ -1,5 +1,5 @@
 use std::fmt;
-use std::{collections::HashMap, convert::TryFrom};
+use std::{borrow::Cow, collections::HashMap, convert::TryFrom};
 
 use pyo3::{exceptions::PyValueError, prelude::*, types::PyBytes};
 
@@ -64,18 +64,18 @@ pub enum FormData {
 }
 
 impl FormData {
-    pub fn append_data(&mut self, data: Vec<u8>) {
+    pub fn append_data(&mut self, data: &[u8]) {
         match self {
-            FormData::Field { data: field_data, .. } => field_data.0.extend(data),
-            FormData::File { data: file_data, .. } => file_data.0.extend(data),
+            FormData::Field { data: field_data, .. } => field_data.0.extend_from_slice(data),
+            FormData::File { data: file_data, .. } => file_data.0.extend_from_slice(data),
         }
     }
 }
 
-impl TryFrom<HashMap<String, String>> for FormData {
+impl TryFrom<HashMap<Cow<'static, str>, String>> for FormData {
     type Error = PyErr;
 
-    fn try_from(headers: HashMap<String, String>) -> PyResult<Self> {
+    fn try_from(headers: HashMap<Cow<'static, str>, String>) -> PyResult<Self> {
         let (content_type, params) = match headers.get("content-type") {
             Some(value) => match headers::parse_options_header(value.to_string()) {
                 Ok((content_type, params)) => (content_type, params),
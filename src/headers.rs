@@ -1,4 +1,80 @@
-use std::collections::HashMap;
+use std::{borrow::Cow, collections::HashMap, str};
+
+use memchr::memchr;
+
+/// The bytes allowed in a header name, a `token` made of `tchar`s.
+/// [RFC 7230 - Section 3.2.6](https://datatracker.ietf.org/doc/html/rfc7230#section-3.2.6)
+const TOKEN: [bool; 256] = {
+    let mut table = [false; 256];
+    let mut c = 0;
+    while c < table.len() {
+        table[c] = matches!(c as u8,
+            b'!' | b'#' | b'$' | b'%' | b'&' | b'\'' | b'*' | b'+' | b'-' | b'.' | b'^' | b'_' | b'`' | b'|' | b'~'
+            | b'0'..=b'9' | b'a'..=b'z' | b'A'..=b'Z'
+        );
+        c += 1;
+    }
+    table
+};
+
+/// The bytes allowed in a header value: visible characters, spaces, tabs and `obs-text`.
+/// Control characters, and in particular a bare CR, are rejected.
+/// [RFC 7230 - Section 3.2](https://datatracker.ietf.org/doc/html/rfc7230#section-3.2)
+const FIELD_VALUE: [bool; 256] = {
+    let mut table = [false; 256];
+    let mut c = 0;
+    while c < table.len() {
+        table[c] = matches!(c as u8, b'\t' | b' '..=b'~' | 0x80..=0xFF);
+        c += 1;
+    }
+    table
+};
+
+/// Strip the optional whitespace (spaces and tabs) around a header value.
+/// [RFC 7230 - Section 3.2.3](https://datatracker.ietf.org/doc/html/rfc7230#section-3.2.3)
+fn trim_whitespace(mut value: &[u8]) -> &[u8] {
+    while let [b' ' | b'\t', rest @ ..] = value {
+        value = rest;
+    }
+    while let [rest @ .., b' ' | b'\t'] = value {
+        value = rest;
+    }
+    value
+}
+
+/// The header names found on almost every part, which don't need to be allocated.
+const COMMON_HEADERS: [&str; 3] = ["content-disposition", "content-type", "content-length"];
+
+/// Parse a single `name: value` header line, without the trailing CRLF.
+///
+/// The name is lowercased, and must be a valid token: whitespace before the colon is rejected.
+/// [RFC 7230 - Section 3.2.4](https://datatracker.ietf.org/doc/html/rfc7230#section-3.2.4)
+pub fn parse_header(line: &[u8]) -> Result<(Cow<'static, str>, String), String> {
+    let index = memchr(b':', line).ok_or("Malformed header")?;
+    let (name, value) = (&line[..index], &line[index + 1..]);
+
+    if name.is_empty() || !name.iter().all(|&c| TOKEN[c as usize]) {
+        return Err("Invalid header name".to_string());
+    }
+
+    if let Some(&c) = value.iter().find(|&&c| !FIELD_VALUE[c as usize]) {
+        return match c {
+            b'\r' => Err("Invalid line break in header".to_string()),
+            _ => Err("Invalid header value".to_string()),
+        };
+    }
+
+    // Names are ASCII tokens, so there is no need for Unicode case mapping.
+    let name = match COMMON_HEADERS.iter().find(|common| name.eq_ignore_ascii_case(common.as_bytes())) {
+        Some(common) => Cow::Borrowed(*common),
+        None => Cow::Owned(str::from_utf8(name).map_err(|_| "Invalid key")?.to_ascii_lowercase()),
+    };
+
+    // TODO: The encoding should be determined by the HTTP Content-Type header.
+    let value = str::from_utf8(trim_whitespace(value)).map_err(|_| "Invalid value")?;
+
+    Ok((name, value.to_string()))
+}
 
 /// Parse `Content-Type` like headers.
 ///
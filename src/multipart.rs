@@ -15,23 +15,36 @@
 //! ```
 
 use core::fmt;
-use std::{collections::HashMap, str};
+use std::{
+    borrow::Cow,
+    collections::{HashMap, VecDeque},
+    ops::RangeInclusive,
+};
 
 use log::debug;
+use memchr::{memchr_iter, memmem};
 use pyo3::{
+    buffer::PyBuffer,
     exceptions::{PyRuntimeError, PyValueError},
     prelude::*,
     types::PyBytes,
 };
 
-use crate::form_data::FormData;
+use crate::{form_data::FormData, headers};
 
 const CR: u8 = b'\r';
 const LF: u8 = b'\n';
 const CRLF: [u8; 2] = [CR, LF];
 
-#[pyclass(eq, eq_int)]
-#[derive(Clone, PartialEq, Debug)]
+/// According to https://www.rfc-editor.org/rfc/rfc2046.html#section-5.1.1, the boundary
+/// should be between 1 and 70 bytes.
+const BOUNDARY_LENGTH: RangeInclusive<usize> = 1..=70;
+
+/// The chunk size from which `parse` releases the GIL.
+const RELEASE_GIL_THRESHOLD: usize = 64 * 1024;
+
+#[pyclass(eq, eq_int, frozen)]
+#[derive(Clone, Copy, PartialEq, Eq, Debug)]
 pub enum MultipartState {
     #[pyo3(name = "PREAMBLE")]
     Preamble,
@@ -65,27 +78,6 @@ pub enum MultipartPart {
     Body { data: BytesWrapper, complete: bool },
 }
 
-impl MultipartPart {
-    fn build_header(data: &[u8]) -> PyResult<Self> {
-        let parts = match data.iter().position(|&c| c == b':') {
-            Some(index) => index,
-            None => return Err(PyValueError::new_err("Malformed header")),
-        };
-
-        let key = &data[..parts];
-        let value = &data[parts + 1..];
-
-        // TODO: The encoding should be determined by the HTTP Content-Type header.
-        let key = str::from_utf8(key).map_err(|_| PyValueError::new_err("Invalid key"))?.trim();
-        let value = str::from_utf8(value).map_err(|_| PyValueError::new_err("Invalid value"))?.trim();
-
-        Ok(MultipartPart::Header {
-            name: key.to_lowercase(),
-            value: value.to_string(),
-        })
-    }
-}
-
 #[pymethods]
 impl MultipartPart {
     fn __repr__(&self) -> String {
@@ -106,26 +98,38 @@ pub struct MultipartParser {
     _header_charset: String,
 
     _state: MultipartState,
+
+    /// The data left unparsed by the previous chunks.
     _buffer: Vec<u8>,
 
-    /// The boundary with a leading `--`.
-    _dash_boundary: Vec<u8>,
+    /// The total size of the data received so far.
+    _size: usize,
+
+    /// Searcher for the boundary with a leading `--`.
+    _dash_boundary: memmem::Finder<'static>,
+
+    /// Searcher for the combination of CRLF + `--` + boundary.
+    _delimiter: memmem::Finder<'static>,
 
-    /// The combination of CRLF + `--` + boundary.
-    _delimiter: Vec<u8>,
+    /// Searcher for the empty line that ends a headers block.
+    _headers_end: memmem::Finder<'static>,
 
     _offset: usize,
-    _events: Vec<MultipartPart>,
+
+    /// Where to resume the search for the end of the headers block, relative to `_offset`.
+    _header_search_offset: usize,
+
+    _events: VecDeque<MultipartPart>,
     _need_data: bool,
 
     /// The headers of the current part.
-    _current_headers: HashMap<String, String>,
+    _current_headers: HashMap<Cow<'static, str>, String>,
 
     /// The current part being parsed.
     _current_part: Option<FormData>,
 
     /// The parsed parts.
-    _parts: Vec<FormData>,
+    _parts: VecDeque<FormData>,
 }
 
 #[pymethods]
@@ -134,9 +138,7 @@ impl MultipartParser {
     #[new]
     #[pyo3(signature = (boundary, max_size = None, header_charset = "utf8"))]
     fn new(boundary: Vec<u8>, max_size: Option<usize>, header_charset: Option<&str>) -> PyResult<Self> {
-        // According to https://www.rfc-editor.org/rfc/rfc2046.html#section-5.1.1, the boundary
-        // should be between 1 and 70 bytes.
-        if boundary.len() < 1 || boundary.len() > 70 {
+        if !BOUNDARY_LENGTH.contains(&boundary.len()) {
             return Err(PyValueError::new_err("Boundary length must be between 1 and 70 characters."));
         }
 
@@ -145,8 +147,13 @@ impl MultipartParser {
             return Err(PyRuntimeError::new_err("The only supported charset is 'utf8'."));
         }
 
-        let _dash_boundary = [b"--".as_slice(), &boundary].concat();
-        let _delimiter = [b"\r\n".as_slice(), &_dash_boundary].concat();
+        let dash_boundary = [b"--".as_slice(), &boundary].concat();
+        let delimiter = [b"\r\n".as_slice(), &dash_boundary].concat();
+
+        // The searchers preprocess the needle once, so the hot path doesn't have to.
+        let _dash_boundary = memmem::Finder::new(&dash_boundary).into_owned();
+        let _delimiter = memmem::Finder::new(&delimiter).into_owned();
+        let _headers_end = memmem::Finder::new(b"\r\n\r\n");
 
         Ok(MultipartParser {
             _boundary: boundary,
@@ -154,40 +161,90 @@ impl MultipartParser {
             _header_charset: header_charset.unwrap_or("utf8").to_string(),
             _state: MultipartState::Preamble,
             _buffer: Vec::new(),
+            _size: 0,
             _dash_boundary,
             _delimiter,
+            _headers_end,
             _offset: 0,
-            _events: Vec::new(),
+            _header_search_offset: 0,
+            _events: VecDeque::new(),
             _need_data: false,
 
             _current_headers: HashMap::new(),
             _current_part: None,
-            _parts: Vec::new(),
+            _parts: VecDeque::new(),
         })
     }
 
     #[getter]
     fn state(&self) -> PyResult<MultipartState> {
-        Ok(self._state.clone())
+        Ok(self._state)
     }
 
-    fn parse(&mut self, data: Vec<u8>) -> PyResult<()> {
+    fn parse(&mut self, py: Python<'_>, data: &Bound<'_, PyAny>) -> PyResult<()> {
+        // `bytes` are borrowed, and `bytearray` copied at once. Other buffers (e.g. `memoryview`) go through the buffer protocol.
+        let data: Cow<'_, [u8]> = match data.extract() {
+            Ok(data) => data,
+            Err(_) => Cow::Owned(PyBuffer::<u8>::get_bound(data)?.to_vec(py)?),
+        };
+
         if self._state == MultipartState::End {
             return Err(PyRuntimeError::new_err("Parser is in the end state."));
         }
 
-        if self.max_size.is_some() && self._buffer.len() + data.len() > self.max_size.unwrap() {
+        if self.max_size.is_some() && self._size + data.len() > self.max_size.unwrap() {
             return Err(PyRuntimeError::new_err("Data exceeds maximum size."));
         }
+        self._size += data.len();
 
-        self._buffer.extend(data);
+        // The parser doesn't touch any Python object while scanning, so other threads can run meanwhile.
+        // For small chunks, releasing and reacquiring the GIL costs more than the parsing itself.
+        match data.len() >= RELEASE_GIL_THRESHOLD {
+            true => py.allow_threads(|| self.run(&data)),
+            false => self.run(&data),
+        }
+    }
+
+    fn next_part(&mut self) -> PyResult<Option<FormData>> {
+        Ok(self._parts.pop_front())
+    }
+
+    fn next_event(&mut self) -> PyResult<Option<MultipartPart>> {
+        Ok(self._events.pop_front())
+    }
+}
+
+impl MultipartParser {
+    fn run(&mut self, data: &[u8]) -> PyResult<()> {
+        let mut buffer = std::mem::take(&mut self._buffer);
+
+        // When nothing is left from the previous chunks (e.g. a form sent in a single chunk),
+        // we parse `data` in place, and only copy what is left unparsed.
+        // In both cases, the parsed data is dropped, so the buffer doesn't grow with the size of the whole stream.
+        let result = if buffer.is_empty() {
+            let result = self.parse_data(data);
+            buffer.extend_from_slice(&data[self._offset..]);
+            result
+        } else {
+            buffer.extend_from_slice(data);
+            let result = self.parse_data(&buffer);
+            buffer.drain(..self._offset);
+            result
+        };
+
+        self._buffer = buffer;
+        self._offset = 0;
+        result
+    }
+
+    fn parse_data(&mut self, data: &[u8]) -> PyResult<()> {
         self._need_data = false;
 
         loop {
             self._state = match self._state {
-                MultipartState::Preamble => self.handle_preamble(),
-                MultipartState::Header => self.handle_header(),
-                MultipartState::Body => self.handle_body(),
+                MultipartState::Preamble => self.handle_preamble(data),
+                MultipartState::Header => self.handle_header(data),
+                MultipartState::Body => self.handle_body(data),
                 MultipartState::End => break,
             }?;
 
@@ -200,163 +257,132 @@ impl MultipartParser {
         Ok(())
     }
 
-    fn next_part(&mut self) -> PyResult<Option<FormData>> {
-        match self._parts.is_empty() {
-            true => Ok(None),
-            false => Ok(Some(self._parts.remove(0))),
-        }
-    }
-
-    fn next_event(&mut self) -> PyResult<Option<MultipartPart>> {
-        match self._events.is_empty() {
-            true => Ok(None),
-            false => Ok(Some(self._events.remove(0))),
-        }
-    }
-}
-
-impl MultipartParser {
-    fn handle_preamble(&mut self) -> PyResult<MultipartState> {
-        let delimiter = self._dash_boundary.clone();
-        let delimiter_len = delimiter.len();
-        let buffer = self._buffer[self._offset..].to_vec();
-
-        if let Some(index) = buffer.windows(delimiter_len).position(|window| window == delimiter) {
-            if let Some(after_delimiter) = buffer.get(index + delimiter_len..) {
-                let tail = after_delimiter.get(..2).unwrap_or_default();
+    fn handle_preamble(&mut self, data: &[u8]) -> PyResult<MultipartState> {
+        let buffer = &data[self._offset..];
+        let delimiter_len = self._dash_boundary.needle().len();
 
+        if let Some(index) = self._dash_boundary.find(buffer) {
+            return match buffer.get(index + delimiter_len..index + delimiter_len + 2) {
                 // First delimiter found -> End of preamble
-                if tail == CRLF {
+                Some([CR, LF]) => {
                     self._offset += index + delimiter_len + 2;
-                    return Ok(MultipartState::Header);
+                    Ok(MultipartState::Header)
                 }
-
                 // First delimiter is terminator -> Empty multipart stream
-                if tail == b"--" {
-                    return Ok(MultipartState::End);
-                }
-
+                Some([b'-', b'-']) => Ok(MultipartState::End),
                 // Bad newline after valid delimiter -> Broken client
-                if tail == b"\n" {
-                    return Err(PyValueError::new_err("Invalid line break after delimiter"));
+                Some([LF, _]) => Err(PyValueError::new_err("Invalid line break after delimiter")),
+                // Not a delimiter (e.g. CR without LF, or `--boundaryfoo`) -> Move offset past it
+                Some(_) => {
+                    self._offset += index + 1;
+                    Ok(MultipartState::Preamble)
                 }
-
-                // CR found after delimiter, but next byte is not LF -> Move offset
-                if tail.len() > 1 && tail[0] == CR {
-                    self._offset += index + delimiter_len + 1;
-                    return Ok(MultipartState::Preamble);
+                // Delimiter found, but not what follows it -> Wait for more data
+                None => {
+                    self._offset += index;
+                    self._need_data = true;
+                    Ok(MultipartState::Preamble)
                 }
-            }
+            };
         }
 
-        // Delimiter not found -> Skip data
-        self._offset = self._offset.max(self._buffer.len().saturating_sub(delimiter_len + 4));
+        // Delimiter not found -> Skip data, but keep what could be the start of a delimiter
+        self._offset = self._offset.max(data.len().saturating_sub(delimiter_len - 1));
         self._need_data = true;
         Ok(MultipartState::Preamble)
     }
 
-    fn handle_header(&mut self) -> PyResult<MultipartState> {
-        let buffer = self._buffer[self._offset..].to_vec();
-
-        debug!("Buffer: {:?}", bytes_to_str(buffer.clone()));
+    fn handle_header(&mut self, data: &[u8]) -> PyResult<MultipartState> {
+        let buffer = &data[self._offset..];
 
-        // We are looking for a CRLF sequence to separate headers from body.
-        match buffer.windows(2).position(|window| window == CRLF) {
-            Some(index) => {
-                debug!("{:?}: header found at index: {}.", self._state, index);
-                // Empty line found, move to body
-                if index == 0 {
-                    self._offset = self._offset + 2;
-
-                    self._current_part = match FormData::try_from(self._current_headers.clone()) {
-                        Ok(part) => Some(part),
-                        Err(e) => return Err(e),
-                    };
-                    return Ok(MultipartState::Body);
-                } else {
-                    self._offset = self._offset + index + 2;
-                    match MultipartPart::build_header(&buffer[..index]) {
-                        Ok(MultipartPart::Header { name, value }) => {
-                            self._events.push(MultipartPart::Header {
-                                name: name.clone(),
-                                value: value.clone(),
-                            });
-                            self._current_headers.insert(name.clone(), value.clone());
-                            (name, value)
-                        }
-                        Err(e) => return Err(e),
-                        _ => return Err(PyValueError::new_err("Invalid header")),
-                    };
+        debug!("Buffer: \"{}\"", buffer.escape_ascii());
 
-                    return Ok(MultipartState::Header);
-                }
-            }
-            None => match buffer.windows(1).position(|window| window == &[LF]) {
-                Some(_) => {
-                    return Err(PyValueError::new_err("Invalid line break in header"));
+        // We are looking for an empty line (CRLF CRLF) to separate the headers block from body.
+        // A part without headers starts with the empty line right away.
+        let (headers_end, body_start) = match buffer.starts_with(&CRLF) {
+            true => (0, 2),
+            false => match self._headers_end.find(&buffer[self._header_search_offset..]) {
+                Some(index) => {
+                    let index = self._header_search_offset + index;
+                    debug!("{:?}: end of headers found at index: {}.", self._state, index);
+                    (index + 2, index + 4)
                 }
-                // Wait for more data.
                 None => {
+                    // Bad newline in the headers -> Broken client
+                    let start = self._header_search_offset.saturating_sub(1);
+                    let mut line_breaks = memchr_iter(LF, &buffer[start..]).map(|index| start + index);
+                    if line_breaks.any(|index| index == 0 || buffer[index - 1] != CR) {
+                        return Err(PyValueError::new_err("Invalid line break in header"));
+                    }
+
+                    // The empty line may be split across chunks, so we resume the search right before the end.
+                    self._header_search_offset = buffer.len().saturating_sub(3);
                     self._need_data = true;
-                    Ok(MultipartState::Header)
+                    return Ok(MultipartState::Header);
                 }
             },
+        };
+
+        for line in buffer[..headers_end].split_inclusive(|&c| c == LF) {
+            let line = match line.strip_suffix(&CRLF) {
+                Some(line) => line,
+                None => return Err(PyValueError::new_err("Invalid line break in header")),
+            };
+            let (name, value) = headers::parse_header(line).map_err(PyValueError::new_err)?;
+            self._events.push_back(MultipartPart::Header {
+                name: name.to_string(),
+                value: value.clone(),
+            });
+            self._current_headers.insert(name, value);
         }
+
+        self._offset += body_start;
+        self._header_search_offset = 0;
+        self._current_part = Some(FormData::try_from(std::mem::take(&mut self._current_headers))?);
+        Ok(MultipartState::Body)
     }
 
-    fn handle_body(&mut self) -> PyResult<MultipartState> {
-        let buffer = self._buffer[self._offset..].to_vec();
-        let delimiter = self._delimiter.clone();
-        let delimiter_len = delimiter.len();
+    fn handle_body(&mut self, data: &[u8]) -> PyResult<MultipartState> {
+        let buffer = &data[self._offset..];
+        let delimiter_len = self._delimiter.needle().len();
 
-        debug!("Buffer: {:?}", bytes_to_str(buffer.clone()));
+        debug!("Buffer: \"{}\"", buffer.escape_ascii());
 
-        match buffer.windows(delimiter.len()).position(|window| window == delimiter) {
+        match self._delimiter.find(buffer) {
             Some(index) => {
                 debug!("{:?}: delimiter found at index: {}.", self._state, index);
-                match buffer.get(index + delimiter_len..index + delimiter_len + 2) {
-                    Some(tail) => match tail {
-                        [CR, LF] => {
-                            debug!("{:?}: delimiter is CRLF.", self._state);
-                            self._events.push(MultipartPart::Body {
-                                data: BytesWrapper(buffer[..index].to_vec()),
-                                complete: true,
-                            });
-                            self.insert_data(buffer[..index].to_vec(), true)?;
-                            self._offset += index + delimiter_len + 2;
-                            return Ok(MultipartState::Header);
-                        }
-                        // Delimiter was terminator, end of multipart stream.
-                        [b'-', b'-'] => {
-                            self.insert_data(buffer[..index].to_vec(), true)?;
-                            self._events.push(MultipartPart::Body {
-                                data: BytesWrapper(buffer[..index].to_vec()),
-                                complete: true,
-                            });
-                            self._offset += index + delimiter_len + 2;
-                            return Ok(MultipartState::End);
-                        }
-                        _ => {
-                            self._need_data = true;
-                            return Ok(MultipartState::Body);
-                        }
-                    },
+                let next_state = match buffer.get(index + delimiter_len..index + delimiter_len + 2) {
+                    Some([CR, LF]) => {
+                        debug!("{:?}: delimiter is CRLF.", self._state);
+                        MultipartState::Header
+                    }
+                    // Delimiter was terminator, end of multipart stream.
+                    Some([b'-', b'-']) => MultipartState::End,
+                    // Not a delimiter (e.g. `--boundaryfoo`), it's part of the body -> Emit up to its first byte
+                    Some(_) => {
+                        self._offset += index + 1;
+                        self.insert_data(&buffer[..index + 1], false)?;
+                        return Ok(MultipartState::Body);
+                    }
+                    // Delimiter found, but not what follows it -> Wait for more data
                     None => {
                         self._need_data = true;
                         return Ok(MultipartState::Body);
                     }
                 };
+
+                self._offset += index + delimiter_len + 2;
+                self.insert_data(&buffer[..index], true)?;
+                Ok(next_state)
             }
             None => {
                 // Delimiter not found, wait for more data.
+                // Only the end of the buffer that could be the start of a delimiter has to be kept.
                 debug!("{:?}: delimiter not found.", self._state);
-                if buffer.len() > delimiter_len + 3 {
-                    self.insert_data(buffer[..buffer.len() - (delimiter_len + 3)].to_vec(), false)?;
-                    self._events.push(MultipartPart::Body {
-                        data: BytesWrapper(buffer[..buffer.len() - (delimiter_len + 3)].to_vec()),
-                        complete: false,
-                    });
-                    self._offset = self._buffer.len() - (delimiter_len + 3);
+                if buffer.len() >= delimiter_len {
+                    let body = &buffer[..buffer.len() - (delimiter_len - 1)];
+                    self._offset += body.len();
+                    self.insert_data(body, false)?;
                 }
                 self._need_data = true;
                 Ok(MultipartState::Body)
@@ -364,22 +390,25 @@ impl MultipartParser {
         }
     }
 
-    fn insert_data(&mut self, data: Vec<u8>, complete: bool) -> PyResult<()> {
-        match self._current_part.take() {
-            Some(mut part) => {
-                part.append_data(data);
+    /// Append `data` to the current part, and emit it as a `Body` event.
+    fn insert_data(&mut self, data: &[u8], complete: bool) -> PyResult<()> {
+        let part = match self._current_part.as_mut() {
+            Some(part) => part,
+            None => return Err(PyValueError::new_err("Missing current part")),
+        };
+
+        // Copy straight from the buffer: no intermediate `Vec` is shared by the part and the event.
+        part.append_data(data);
+        self._events.push_back(MultipartPart::Body {
+            data: BytesWrapper(data.to_vec()),
+            complete,
+        });
 
-                if complete {
-                    self._parts.push(part);
-                    self._current_part = None;
-                }
+        if complete {
+            if let Some(part) = self._current_part.take() {
+                self._parts.push_back(part);
             }
-            None => return Err(PyValueError::new_err("Missing current part")),
         }
         Ok(())
     }
 }
-
-fn bytes_to_str(data: Vec<u8>) -> String {
-    String::from_utf8(data).unwrap()
-}
@@ -193,3 +193,117 @@ def test_parser_multiple_content_disposition(parser: MultipartParser):
     assert isinstance(part, Field)
     assert part.name == '"field2"'
     assert part.data == b"Big Hello World Message!"
+
+
+def test_parser_body_multiple_chunks(parser: MultipartParser):
+    parser.parse(b'\r\n--boundary\r\ncontent-disposition: form-data; name="file"; filename="example.txt"\r\n\r\n')
+    for _ in range(10):
+        parser.parse(b"Hello World!" * 10)
+    parser.parse(b"\r\n--boundary--")
+    assert parser.state == MultipartState.END, "We should be at the 'END' state, and be done parsing."
+
+    part = parser.next_part()
+    assert isinstance(part, File)
+    assert part.data == b"Hello World!" * 100
+
+
+def test_parser_header_multiple_chunks(parser: MultipartParser):
+    parser.parse(b'\r\n--boundary\r\nContent-Disposition: form-data; name="field1"\r')
+    assert parser.state == MultipartState.HEADER, "We should be at the 'Header' state, and be waiting for a header."
+
+    parser.parse(b"\n\r")
+    assert parser.state == MultipartState.HEADER, "We should be at the 'Header' state, and be waiting for a header."
+
+    parser.parse(b"\n")
+    assert parser.state == MultipartState.BODY, "We should be at the 'Body' state, and be waiting for a body."
+
+    event = parser.next_event()
+    assert isinstance(event, MultipartPart.Header)
+    assert event.name == "content-disposition"
+    assert event.value == 'form-data; name="field1"'
+
+
+def test_parser_header_invalid_line_break(parser: MultipartParser):
+    with pytest.raises(ValueError, match="Invalid line break in header"):
+        parser.parse(b'\r\n--boundary\r\nContent-Disposition: form-data; name="field1"\n')
+
+
+def test_parser_header_invalid_name(parser: MultipartParser):
+    with pytest.raises(ValueError, match="Invalid header name"):
+        parser.parse(b'\r\n--boundary\r\nContent-Disposition : form-data; name="field1"\r\n\r\n')
+
+
+def test_parser_header_bare_cr(parser: MultipartParser):
+    with pytest.raises(ValueError, match="Invalid line break in header"):
+        parser.parse(b'\r\n--boundary\r\nContent-Disposition: form-data;\r name="field1"\r\n\r\n')
+
+
+def test_parser_max_size():
+    parser = MultipartParser(b"boundary", max_size=20)
+    parser.parse(b"\r\n--boundary\r\n")
+    with pytest.raises(RuntimeError, match="Data exceeds maximum size."):
+        parser.parse(b"\r\n--boundary--")
+
+
+def test_parser_preamble_invalid_line_break_after_delimiter(parser: MultipartParser):
+    with pytest.raises(ValueError, match="Invalid line break after delimiter"):
+        parser.parse(b"--boundary\nContent-Disposition: form-data")
+
+
+def test_parser_binary_body(parser: MultipartParser):
+    parser.parse(b'\r\n--boundary\r\ncontent-disposition: form-data; name="file"; filename="image.png"\r\n\r\n\x89PNG\xff\xfe\x00')
+    parser.parse(b"\xff\r\n--boundary--")
+    assert parser.state == MultipartState.END, "We should be at the 'END' state, and be done parsing."
+
+    part = parser.next_part()
+    assert isinstance(part, File)
+    assert part.data == b"\x89PNG\xff\xfe\x00\xff"
+
+
+def test_parser_state_compares_to_int(parser: MultipartParser):
+    assert parser.state == MultipartState.PREAMBLE == 0
+
+    parser.parse(b"\r\n--boundary\r\n")
+    assert parser.state == MultipartState.HEADER == 1
+
+
+def test_parser_headers_not_inherited_from_previous_part(parser: MultipartParser):
+    with pytest.raises(ValueError, match="Missing content-disposition header"):
+        parser.parse(
+            b"\r\n--boundary\r\n"
+            b'content-disposition: form-data; name="field1"\r\n'
+            b"\r\n"
+            b"Hello World!\r\n"
+            b"--boundary\r\n"
+            b"content-type: text/plain\r\n"
+            b"\r\n"
+            b"Big Hello World Message!"
+            b"\r\n--boundary--"
+        )
+
+
+@pytest.mark.parametrize("wrap", [bytes, bytearray, memoryview])
+def test_parser_bytes_like_data(parser: MultipartParser, wrap):
+    parser.parse(wrap(b'\r\n--boundary\r\ncontent-disposition: form-data; name="field1"\r\n\r\nHello World!\r\n--boundary--'))
+    assert parser.state == MultipartState.END, "We should be at the 'END' state, and be done parsing."
+
+    part = parser.next_part()
+    assert isinstance(part, Field)
+    assert part.data == b"Hello World!"
+
+
+def test_parser_body_false_delimiter(parser: MultipartParser):
+    parser.parse(b'\r\n--boundary\r\ncontent-disposition: form-data; name="file"; filename="example.txt"\r\n\r\nabc\r\n--boundaryX')
+    assert isinstance(parser.next_event(), MultipartPart.Header)
+
+    for _ in range(10):
+        parser.parse(b"Hello World!" * 10)
+        assert isinstance(parser.next_event(), MultipartPart.Body), "The body should keep streaming after a false delimiter."
+        while parser.next_event() is not None:
+            pass
+    parser.parse(b"\r\n--boundary--")
+    assert parser.state == MultipartState.END, "We should be at the 'END' state, and be done parsing."
+
+    part = parser.next_part()
+    assert isinstance(part, File)
+    assert part.data == b"abc\r\n--boundaryX" + b"Hello World!" * 100